@@ -1,9 +1,11 @@
 from chat_exporter.chat_exporter import (
     export,
+    export_to_path,
     raw_export,
     quick_export,
     link,
     quick_link,
+    cache_clear,
     AttachmentHandler,
     AttachmentToLocalFileHostHandler,
     AttachmentToDiscordChannelHandler)
@@ -12,10 +14,12 @@ __version__ = "2.7.1"
 
 __all__ = (
     export,
+    export_to_path,
     raw_export,
     quick_export,
     link,
     quick_link,
+    cache_clear,
     AttachmentHandler,
     AttachmentToLocalFileHostHandler,
     AttachmentToDiscordChannelHandler,
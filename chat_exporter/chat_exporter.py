@@ -1,11 +1,85 @@
+import asyncio
 import datetime
+import functools
 import io
-from typing import List, Optional
+import os
+from typing import Dict, List, Optional, Union
 
 from chat_exporter.construct.transcript import Transcript
+from chat_exporter.ext.cache import TTLCache
 from chat_exporter.ext.discord_import import discord
 from chat_exporter.construct.attachment_handler import AttachmentHandler, AttachmentToLocalFileHostHandler, AttachmentToDiscordChannelHandler
 
+_TRANSCRIPT_EMBED_DESC = "**Transcript Name:** transcript-{}\n\n"
+_BLURPLE = discord.Colour.blurple()
+_LINK_PREFIX = "https://mahto.id/chat-exporter?url="
+_FILENAME_TABLE = str.maketrans({c: "_" for c in '<>:"/\\|?*'})
+
+_transcript_cache = TTLCache(maxsize=64, ttl=60)
+_inflight: Dict[tuple, asyncio.Future] = {}
+
+
+def cache_clear():
+    """
+    Drop every transcript held by the export cache.
+    Transcripts are kept for 60 seconds, call this if edits within that window must show up straight away.
+    """
+    _transcript_cache.clear()
+
+
+@functools.lru_cache(maxsize=1024)
+def _safe_name(channel_id: int, name: str) -> str:
+    # keyed on the name as well, so a renamed channel gets a fresh entry
+    return name.translate(_FILENAME_TABLE)
+
+
+def _check_limits(concurrency: int, max_retries: int):
+    # a semaphore of 0 would never let a member lookup through and hang the export
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+    if max_retries < 0:
+        raise ValueError(f"max_retries can't be negative, got {max_retries}")
+
+
+def _channel_key(channel: discord.TextChannel, *options) -> tuple:
+    return (channel.id, getattr(channel, "last_message_id", None)) + options
+
+
+async def _cached_export(key: tuple, transcript: Transcript, as_bytes: bool = False) -> Union[str, bytes]:
+    # the encoded and the plain transcript of the same channel are cached side by side
+    key += (as_bytes,)
+    try:
+        return _transcript_cache[key]
+    except KeyError:
+        pass
+
+    # The transcript is built in a task of its own that every caller, the first one included, waits on
+    # through a shield. Cancelling one of them then only stops that caller's wait, not the shared build.
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_build_export(key, transcript, as_bytes))
+        _inflight[key] = task
+        task.add_done_callback(functools.partial(_finish_export, key))
+    return await asyncio.shield(task)
+
+
+async def _build_export(key: tuple, transcript: Transcript, as_bytes: bool) -> Union[str, bytes]:
+    if as_bytes:
+        result = await transcript.export_bytes()
+    else:
+        result = (await transcript.export()).html
+    if not transcript.failed:
+        _transcript_cache[key] = result
+    return result
+
+
+def _finish_export(key: tuple, task: asyncio.Future):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    # retrieve it here so a build nobody waits on anymore does not leave an unretrieved exception behind
+    if not task.cancelled():
+        task.exception()
+
 
 async def quick_export(
     channel: discord.TextChannel,
@@ -24,31 +98,32 @@ async def quick_export(
     if guild:
         channel.guild = guild
 
-    transcript = (
-        await Transcript(
-            channel=channel,
-            limit=None,
-            messages=None,
-            pytz_timezone="UTC",
-            military_time=True,
-            fancy_times=True,
-            before=None,
-            after=None,
-            support_dev=True,
-            bot=bot,
-            attachment_handler=None
-            ).export()
-        ).html
-
-    if not transcript:
+    key = _channel_key(channel, None, None, None, True, True, "UTC", True, bot, None)
+    data = await _cached_export(key, Transcript(
+        channel=channel,
+        limit=None,
+        messages=None,
+        pytz_timezone="UTC",
+        military_time=True,
+        fancy_times=True,
+        before=None,
+        after=None,
+        support_dev=True,
+        bot=bot,
+        attachment_handler=None
+    ), as_bytes=True)
+
+    if not data:
         return
 
+    name = _safe_name(channel.id, channel.name)
     transcript_embed = discord.Embed(
-        description=f"**Transcript Name:** transcript-{channel.name}\n\n",
-        colour=discord.Colour.blurple()
+        description=_TRANSCRIPT_EMBED_DESC.format(name),
+        colour=_BLURPLE
     )
 
-    transcript_file = discord.File(io.BytesIO(transcript.encode()), filename=f"transcript-{channel.name}.html")
+    # BytesIO shares the buffer of an immutable bytes object, so this is the only copy of the encoded transcript
+    transcript_file = discord.File(io.BytesIO(data), filename=f"transcript-{name}.html")
     return await channel.send(embed=transcript_embed, file=transcript_file)
 
 
@@ -64,13 +139,15 @@ async def export(
     after: Optional[datetime.datetime] = None,
     support_dev: Optional[bool] = True,
     attachment_handler: Optional[AttachmentHandler] = None,
+    concurrency: int = 8,
+    max_retries: int = 5,
 ):
     """
     Create a customised transcript of your Discord channel.
     This function will return the transcript which you can then turn in to a file to post wherever.
     :param channel: discord.TextChannel - channel to Export
     :param limit: (optional) integer - limit of messages to capture
-    :param tz_info: (optional) TZ Database Name - set the timezone of your transcript
+    :param tz_info: (optional) TZ Database Name - set the timezone of your transcript (looked up with zoneinfo)
     :param guild: (optional) discord.Guild - solution for edpy
     :param bot: (optional) discord.Client - set getting member role colour
     :param military_time: (optional) boolean - set military time (24hour clock)
@@ -78,26 +155,92 @@ async def export(
     :param before: (optional) datetime.datetime - allows before time for history
     :param after: (optional) datetime.datetime - allows after time for history
     :param attachment_handler: (optional) attachment_handler.AttachmentHandler - allows custom asset handling
+    :param concurrency: (optional) integer - limit of member lookups sent to Discord at once (at least 1)
+    :param max_retries: (optional) integer - retries with exponential backoff when Discord rate limits a request (0 or more)
     :return: string - transcript file make up
     """
+    _check_limits(concurrency, max_retries)
+
+    if guild:
+        channel.guild = guild
+
+    key = _channel_key(
+        channel, limit, before, after, military_time, fancy_times, tz_info, support_dev, bot, attachment_handler
+    )
+    return await _cached_export(key, Transcript(
+        channel=channel,
+        limit=limit,
+        messages=None,
+        pytz_timezone=tz_info,
+        military_time=military_time,
+        fancy_times=fancy_times,
+        before=before,
+        after=after,
+        support_dev=support_dev,
+        bot=bot,
+        attachment_handler=attachment_handler,
+        concurrency=concurrency,
+        max_retries=max_retries,
+    ))
+
+
+async def export_to_path(
+    channel: discord.TextChannel,
+    path: Union[str, os.PathLike],
+    limit: Optional[int] = None,
+    tz_info="UTC",
+    guild: Optional[discord.Guild] = None,
+    bot: Optional[discord.Client] = None,
+    military_time: Optional[bool] = True,
+    fancy_times: Optional[bool] = True,
+    before: Optional[datetime.datetime] = None,
+    after: Optional[datetime.datetime] = None,
+    support_dev: Optional[bool] = True,
+    attachment_handler: Optional[AttachmentHandler] = None,
+    concurrency: int = 8,
+    max_retries: int = 5,
+):
+    """
+    Create a customised transcript of your Discord channel and write it straight to a file.
+    This function takes the same arguments as export(), each message is written out as soon as it is rendered.
+    Nothing is written if the transcript fails to build.
+    :param channel: discord.TextChannel - channel to Export
+    :param path: str or os.PathLike - file to write the transcript to
+    :param limit: (optional) integer - limit of messages to capture
+    :param tz_info: (optional) TZ Database Name - set the timezone of your transcript (looked up with zoneinfo)
+    :param guild: (optional) discord.Guild - solution for edpy
+    :param bot: (optional) discord.Client - set getting member role colour
+    :param military_time: (optional) boolean - set military time (24hour clock)
+    :param fancy_times: (optional) boolean - set javascript around time display
+    :param before: (optional) datetime.datetime - allows before time for history
+    :param after: (optional) datetime.datetime - allows after time for history
+    :param attachment_handler: (optional) attachment_handler.AttachmentHandler - allows custom asset handling
+    :param concurrency: (optional) integer - limit of member lookups sent to Discord at once (at least 1)
+    :param max_retries: (optional) integer - retries with exponential backoff when Discord rate limits a request (0 or more)
+    :return: boolean - whether the transcript was built without errors, and so written to the file
+    """
+    _check_limits(concurrency, max_retries)
+
     if guild:
         channel.guild = guild
 
-    return (
-        await Transcript(
-            channel=channel,
-            limit=limit,
-            messages=None,
-            pytz_timezone=tz_info,
-            military_time=military_time,
-            fancy_times=fancy_times,
-            before=before,
-            after=after,
-            support_dev=support_dev,
-            bot=bot,
-            attachment_handler=attachment_handler,
-        ).export()
-    ).html
+    transcript = await Transcript(
+        channel=channel,
+        limit=limit,
+        messages=None,
+        pytz_timezone=tz_info,
+        military_time=military_time,
+        fancy_times=fancy_times,
+        before=before,
+        after=after,
+        support_dev=support_dev,
+        bot=bot,
+        attachment_handler=attachment_handler,
+        concurrency=concurrency,
+        max_retries=max_retries,
+    ).export_to_file(path)
+
+    return not transcript.failed
 
 
 async def raw_export(
@@ -110,38 +253,50 @@ async def raw_export(
     fancy_times: Optional[bool] = True,
     support_dev: Optional[bool] = True,
     attachment_handler: Optional[AttachmentHandler] = None,
+    concurrency: int = 8,
+    max_retries: int = 5,
 ):
     """
     Create a customised transcript with your own captured Discord messages
     This function will return the transcript which you can then turn in to a file to post wherever.
     :param channel: discord.TextChannel - channel to Export
     :param messages: List[discord.Message] - list of Discord messages to export
-    :param tz_info: (optional) TZ Database Name - set the timezone of your transcript
+    :param tz_info: (optional) TZ Database Name - set the timezone of your transcript (looked up with zoneinfo)
     :param guild: (optional) discord.Guild - solution for edpy
     :param bot: (optional) discord.Client - set getting member role colour
     :param military_time: (optional) boolean - set military time (24hour clock)
     :param fancy_times: (optional) boolean - set javascript around time display
     :param attachment_handler: (optional) AttachmentHandler - allows custom asset handling
+    :param concurrency: (optional) integer - limit of member lookups sent to Discord at once (at least 1)
+    :param max_retries: (optional) integer - retries with exponential backoff when Discord rate limits a request (0 or more)
     :return: string - transcript file make up
     """
+    _check_limits(concurrency, max_retries)
+
     if guild:
         channel.guild = guild
 
-    return (
-        await Transcript(
-            channel=channel,
-            limit=None,
-            messages=messages,
-            pytz_timezone=tz_info,
-            military_time=military_time,
-            fancy_times=fancy_times,
-            before=None,
-            after=None,
-            support_dev=support_dev,
-            bot=bot,
-            attachment_handler=attachment_handler
-        ).export()
-    ).html
+    # Transcript reverses the list in place, so the key has to be taken first. The messages come from the caller,
+    # so an edit to one of them has to miss the cache too.
+    key = (
+        channel.id, tuple((m.id, m.edited_at) for m in messages), military_time, fancy_times, tz_info, support_dev,
+        bot, attachment_handler
+    )
+    return await _cached_export(key, Transcript(
+        channel=channel,
+        limit=None,
+        messages=messages,
+        pytz_timezone=tz_info,
+        military_time=military_time,
+        fancy_times=fancy_times,
+        before=None,
+        after=None,
+        support_dev=support_dev,
+        bot=bot,
+        attachment_handler=attachment_handler,
+        concurrency=concurrency,
+        max_retries=max_retries,
+    ))
 
 
 async def quick_link(
@@ -155,17 +310,21 @@ async def quick_link(
     :param message: discord.Message
     :return: discord.Message (posted link)
     """
-    embed = discord.Embed(
-        title="Transcript Link",
-        description=(
-            f"[Click here to view the transcript](https://mahto.id/chat-exporter?url={message.attachments[0].url})"
-        ),
-        colour=discord.Colour.blurple(),
-    )
+    # the cached embed is shared, hand out a copy so callers can't change it for everyone
+    embed = _build_link_embed(message.attachments[0].url).copy()
 
     return await channel.send(embed=embed)
 
 
+@functools.lru_cache(maxsize=256)
+def _build_link_embed(url: str) -> discord.Embed:
+    return discord.Embed(
+        title="Transcript Link",
+        description=f"[Click here to view the transcript]({_LINK_PREFIX}{url})",
+        colour=_BLURPLE,
+    )
+
+
 async def link(
     message: discord.Message
 ):
@@ -175,4 +334,4 @@ async def link(
     :param message: discord.Message
     :return: string (link: https://mahto.id/chat-exporter?url=ATTACHMENT_URL)
     """
-    return "https://mahto.id/chat-exporter?url=" + message.attachments[0].url
+    return _LINK_PREFIX + message.attachments[0].url
@@ -1,6 +1,5 @@
-import html
-
 from chat_exporter.ext.discord_import import discord
+from chat_exporter.ext.escape import escape
 
 from chat_exporter.ext.html_generator import (
     fill_out,
@@ -69,7 +68,7 @@ class Embed:
         )
 
     async def build_title(self):
-        self.title = html.escape(self.embed.title) if self.embed.title != self.check_against else ""
+        self.title = escape(self.embed.title) if self.embed.title != self.check_against else ""
 
         if self.title:
             self.title = await fill_out(self.guild, embed_title, [
@@ -77,7 +76,7 @@ class Embed:
             ])
 
     async def build_description(self):
-        self.description = html.escape(self.embed.description) if self.embed.description != self.check_against else ""
+        self.description = escape(self.embed.description) if self.embed.description != self.check_against else ""
 
         if self.description:
             self.description = await fill_out(self.guild, embed_description, [
@@ -92,8 +91,8 @@ class Embed:
             return
 
         for field in self.embed.fields:
-            field.name = html.escape(field.name)
-            field.value = html.escape(field.value)
+            field.name = escape(field.name)
+            field.value = escape(field.value)
 
             if field.inline:
                 self.fields += await fill_out(self.guild, embed_field_inline, [
@@ -106,7 +105,7 @@ class Embed:
                     ("FIELD_VALUE", field.value, PARSE_MODE_EMBED)])
 
     async def build_author(self):
-        self.author = html.escape(self.embed.author.name) if (
+        self.author = escape(self.embed.author.name) if (
                 self.embed.author and self.embed.author.name != self.check_against
         ) else ""
 
@@ -136,7 +135,7 @@ class Embed:
             if self.embed.thumbnail and self.embed.thumbnail.url != self.check_against else ""
 
     async def build_footer(self):
-        self.footer = html.escape(self.embed.footer.text) if (
+        self.footer = escape(self.embed.footer.text) if (
                 self.embed.footer and self.embed.footer.text != self.check_against
         ) else ""
 
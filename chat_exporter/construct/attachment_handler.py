@@ -1,17 +1,37 @@
 import datetime
 import io
 import pathlib
-from typing import Union
+import time
+import urllib.parse
+from typing import Optional, Union
 
 import aiohttp
+from chat_exporter.ext.cache import TTLCache
 from chat_exporter.ext.discord_import import discord
 
 
+def _url_lifetime(url: str) -> Optional[float]:
+	"""Seconds until a signed Discord CDN url expires, from its hex ex= parameter, or None if it has none."""
+	try:
+		expires = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)["ex"][0]
+		return int(expires, 16) - time.time()
+	except (KeyError, ValueError, TypeError):
+		return None
+
+
 class AttachmentHandler:
 	"""Handle the saving of attachments (images, videos, audio, etc.)
 
 	Subclass this to implement your own asset handler."""
 
+	# Set cache_assets in a subclass to reuse the url of an attachment that was processed before, for up to
+	# asset_cache_ttl seconds. Signed Discord CDN urls are only reused until asset_url_margin seconds before
+	# their own expiry, and at most asset_cache_size urls are kept.
+	cache_assets: bool = False
+	asset_cache_ttl: float = 3600
+	asset_cache_size: int = 1024
+	asset_url_margin: float = 3600
+
 	async def process_asset(self, attachment: discord.Attachment) -> discord.Attachment:
 		"""Implement this to process the asset and return a url to the stored attachment.
 		:param attachment: discord.Attachment
@@ -19,9 +39,45 @@ class AttachmentHandler:
 		"""
 		raise NotImplementedError
 
+	async def _process_cached(self, attachment: discord.Attachment) -> discord.Attachment:
+		"""Process the asset, reusing the stored url of an attachment processed before if the handler caches assets.
+		:param attachment: discord.Attachment
+		:return: discord.Attachment
+		"""
+		if not self.cache_assets:
+			return await self.process_asset(attachment)
+
+		# set up lazily, subclasses are not required to call our __init__
+		cache = getattr(self, "_asset_cache", None)
+		if cache is None:
+			cache = self._asset_cache = TTLCache(maxsize=self.asset_cache_size, ttl=self.asset_cache_ttl)
+
+		try:
+			attachment.url, attachment.proxy_url = cache[attachment.id]
+			return attachment
+		except KeyError:
+			pass
+
+		# keyed on the original id, a handler may hand back a different attachment
+		processed = await self.process_asset(attachment)
+		ttl = self.asset_cache_ttl
+		lifetime = _url_lifetime(processed.url)
+		if lifetime is not None:
+			ttl = min(ttl, lifetime - self.asset_url_margin)
+		if ttl > 0:
+			cache.set(attachment.id, (processed.url, processed.proxy_url), ttl)
+		return processed
+
+	def clear_asset_cache(self):
+		"""Forget the stored urls, so every attachment is processed again on the next export."""
+		self._asset_cache = None
+
+
 class AttachmentToLocalFileHostHandler(AttachmentHandler):
 	"""Save the assets to a local file host and embed the assets in the transcript from there."""
 
+	cache_assets = True
+
 	def __init__(self, base_path: Union[str, pathlib.Path], url_base: str):
 		if isinstance(base_path, str):
 			base_path = pathlib.Path(base_path)
@@ -45,6 +101,8 @@ class AttachmentToLocalFileHostHandler(AttachmentHandler):
 class AttachmentToDiscordChannelHandler(AttachmentHandler):
 	"""Save the attachment to a discord channel and embed the assets in the transcript from there."""
 
+	cache_assets = True
+
 	def __init__(self, channel: discord.TextChannel):
 		self.channel = channel
 
@@ -1,11 +1,11 @@
-import html
+import asyncio
+import functools
 import io
 import traceback
 from typing import List, Optional, Union
 
 import aiohttp
-from pytz import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone, tzinfo
 
 from chat_exporter.construct.attachment_handler import AttachmentHandler
 from chat_exporter.ext.discord_import import discord
@@ -13,9 +13,12 @@ from chat_exporter.ext.discord_import import discord
 from chat_exporter.construct.assets import Attachment, Component, Embed, Reaction
 from chat_exporter.ext.discord_utils import DiscordUtils
 from chat_exporter.ext.discriminator import discriminator
+from chat_exporter.ext.escape import escape
 from chat_exporter.ext.cache import cache
+from chat_exporter.ext.retry import retry
 from chat_exporter.ext.html_generator import (
     fill_out,
+    compile_template,
     bot_tag,
     bot_tag_verified,
     message_body,
@@ -35,6 +38,10 @@ from chat_exporter.ext.html_generator import (
     message_thread_add,
 )
 
+# Follow-up messages fill nothing but plain values, so their template is rendered with
+# its compiled format_map straight away, no need to go through fill_out's parsing.
+_render_message_body, _ = compile_template(message_body)
+
 
 def _gather_user_bot(author: discord.Member):
     if author.bot and author.public_flags.verified_bot:
@@ -44,38 +51,65 @@ def _gather_user_bot(author: discord.Member):
     return ""
 
 
+@functools.lru_cache(maxsize=4096)
+def _format_minute(minute: datetime, tz: tzinfo, time_format: str) -> str:
+    return minute.astimezone(tz).strftime(time_format)
+
+
+def _format_time(time: datetime, tz: tzinfo, time_format: str) -> str:
+    # Every timestamp in a transcript is shown to the minute, so all messages sent within the same
+    # minute share one conversion and strftime call instead of paying for it each.
+    return _format_minute(time.replace(second=0, microsecond=0), tz, time_format)
+
+
 def _set_edit_at(message_edited_at):
     return f'<span class="chatlog__reference-edited-timestamp" data-timestamp="{message_edited_at}">(edited)</span>'
 
 
 class MessageConstruct:
-    message_html: str = ""
+    # one of these is built per message, slots keep them small and their attribute access quick
+    __slots__ = (
+        "message", "previous_message", "tz", "military_time", "guild", "meta_data", "message_dict",
+        "member_dict", "attachment_handler", "time_format", "message_created_at", "message_edited_at",
+        "message_html", "embeds", "reactions", "components", "attachments", "audit",
+    )
+
+    message_html: str
+    message_created_at: str
+    message_edited_at: str
 
     # Asset Types
-    embeds: str = ""
-    reactions: str = ""
-    components: str = ""
-    attachments: str = ""
-    time_format: str = ""
+    embeds: str
+    reactions: str
+    components: str
+    attachments: str
+    time_format: str
 
     def __init__(
         self,
         message: discord.Message,
         previous_message: Optional[discord.Message],
-        pytz_timezone,
+        tz: tzinfo,
         military_time: bool,
         guild: discord.Guild,
         meta_data: dict,
         message_dict: dict,
-        attachment_handler: Optional[AttachmentHandler]
+        attachment_handler: Optional[AttachmentHandler],
+        member_dict: Optional[dict] = None,
     ):
         self.message = message
         self.previous_message = previous_message
-        self.pytz_timezone = pytz_timezone
+        self.tz = tz
         self.military_time = military_time
         self.guild = guild
         self.message_dict = message_dict
+        self.member_dict = member_dict if member_dict is not None else {}
         self.attachment_handler = attachment_handler
+        self.message_html = ""
+        self.embeds = ""
+        self.reactions = ""
+        self.components = ""
+        self.attachments = ""
         self.time_format = "%A, %e %B %Y %I:%M %p"
         if self.military_time:
             self.time_format = "%A, %e %B %Y %H:%M"
@@ -154,7 +188,7 @@ class MessageConstruct:
         if self.message_edited_at:
             self.message_edited_at = _set_edit_at(self.message_edited_at)
 
-        self.message.content = html.escape(self.message.content)
+        self.message.content = escape(self.message.content)
         self.message.content = await fill_out(self.guild, message_content, [
             ("MESSAGE_CONTENT", self.message.content, PARSE_MODE_MARKDOWN),
             ("EDIT", self.message_edited_at, PARSE_MODE_NONE)
@@ -200,7 +234,7 @@ class MessageConstruct:
             ("AVATAR_URL", str(avatar_url), PARSE_MODE_NONE),
             ("BOT_TAG", is_bot, PARSE_MODE_NONE),
             ("NAME_TAG", await discriminator(message.author.name, message.author.discriminator), PARSE_MODE_NONE),
-            ("NAME", str(html.escape(message.author.display_name))),
+            ("NAME", str(escape(message.author.display_name))),
             ("USER_COLOUR", user_colour, PARSE_MODE_NONE),
             ("CONTENT", message.content.replace("\n", "").replace("<br>", ""), PARSE_MODE_REFERENCE),
             ("EDIT", message_edited_at, PARSE_MODE_NONE),
@@ -222,7 +256,7 @@ class MessageConstruct:
             ("AVATAR_URL", str(avatar_url), PARSE_MODE_NONE),
             ("BOT_TAG", is_bot, PARSE_MODE_NONE),
             ("NAME_TAG", await discriminator(user.name, user.discriminator), PARSE_MODE_NONE),
-            ("NAME", str(html.escape(user.display_name))),
+            ("NAME", str(escape(user.display_name))),
             ("USER_COLOUR", user_colour, PARSE_MODE_NONE),
             ("FILLER", "used ", PARSE_MODE_NONE),
             ("COMMAND", "/" + self.message.interaction.name, PARSE_MODE_NONE),
@@ -251,10 +285,12 @@ class MessageConstruct:
         for e in self.message.embeds:
             self.embeds += await Embed(e, self.guild).flow()
 
-        for a in self.message.attachments:
-            if self.attachment_handler and isinstance(self.attachment_handler, AttachmentHandler):
-                a = await self.attachment_handler.process_asset(a)
-            self.attachments += await Attachment(a, self.guild).flow()
+        if self.message.attachments:
+            handler = self.attachment_handler if isinstance(self.attachment_handler, AttachmentHandler) else None
+            for a in self.message.attachments:
+                if handler:
+                    a = await handler._process_cached(a)
+                self.attachments += await Attachment(a, self.guild).flow()
 
         for c in self.message.components:
             self.components += await Component(c, self.guild).flow()
@@ -271,16 +307,16 @@ class MessageConstruct:
         if started:
             return self.message_html
 
-        self.message_html += await fill_out(self.guild, message_body, [
-            ("MESSAGE_ID", str(self.message.id)),
-            ("MESSAGE_CONTENT", self.message.content, PARSE_MODE_NONE),
-            ("EMBEDS", self.embeds, PARSE_MODE_NONE),
-            ("ATTACHMENTS", self.attachments, PARSE_MODE_NONE),
-            ("COMPONENTS", self.components, PARSE_MODE_NONE),
-            ("EMOJI", self.reactions, PARSE_MODE_NONE),
-            ("TIMESTAMP", self.message_created_at, PARSE_MODE_NONE),
-            ("TIME", self.message_created_at.split(maxsplit=4)[4], PARSE_MODE_NONE),
-        ])
+        self.message_html += _render_message_body({
+            "MESSAGE_ID": str(self.message.id),
+            "MESSAGE_CONTENT": self.message.content.strip(),
+            "EMBEDS": self.embeds.strip(),
+            "ATTACHMENTS": self.attachments.strip(),
+            "COMPONENTS": self.components.strip(),
+            "EMOJI": self.reactions.strip(),
+            "TIMESTAMP": self.message_created_at.strip(),
+            "TIME": self.message_created_at.split(maxsplit=4)[4].strip(),
+        })
 
         return self.message_html
 
@@ -295,39 +331,38 @@ class MessageConstruct:
     async def generate_message_divider(self, channel_audit=False):
         if channel_audit or self._generate_message_divider_check():
             if self.previous_message is not None:
-                self.message_html += await fill_out(self.guild, end_message, [])
+                self.message_html += end_message
 
             if channel_audit:
                 self.audit = True
                 return
 
             followup_symbol = ""
-            is_bot = _gather_user_bot(self.message.author)
-            avatar_url = self.message.author.display_avatar if self.message.author.display_avatar else DiscordUtils.default_avatar
+            avatar_url, name_tag, user_colour, user_icon, name, is_bot = await self._gather_author(self.message.author)
 
             if self.message.reference != "" or self.message.interaction:
                 followup_symbol = "<div class='chatlog__followup-symbol'></div>"
 
             time = self.message.created_at
             if not self.message.created_at.tzinfo:
-                time = timezone("UTC").localize(time)
+                time = time.replace(tzinfo=timezone.utc)
 
             if self.military_time:
-                default_timestamp = time.astimezone(timezone(self.pytz_timezone)).strftime("%d-%m-%Y %H:%M")
+                default_timestamp = _format_time(time, self.tz, "%d-%m-%Y %H:%M")
             else:
-                default_timestamp = time.astimezone(timezone(self.pytz_timezone)).strftime("%d-%m-%Y %I:%M %p")
+                default_timestamp = _format_time(time, self.tz, "%d-%m-%Y %I:%M %p")
 
             self.message_html += await fill_out(self.guild, start_message, [
                 ("REFERENCE_SYMBOL", followup_symbol, PARSE_MODE_NONE),
                 ("REFERENCE", self.message.reference if self.message.reference else self.message.interaction,
                  PARSE_MODE_NONE),
-                ("AVATAR_URL", str(avatar_url), PARSE_MODE_NONE),
-                ("NAME_TAG", await discriminator(self.message.author.name, self.message.author.discriminator), PARSE_MODE_NONE),
+                ("AVATAR_URL", avatar_url, PARSE_MODE_NONE),
+                ("NAME_TAG", name_tag, PARSE_MODE_NONE),
                 ("USER_ID", str(self.message.author.id)),
-                ("USER_COLOUR", await self._gather_user_colour(self.message.author)),
-                ("USER_ICON", await self._gather_user_icon(self.message.author), PARSE_MODE_NONE),
-                ("NAME", str(html.escape(self.message.author.display_name))),
-                ("BOT_TAG", str(is_bot), PARSE_MODE_NONE),
+                ("USER_COLOUR", user_colour),
+                ("USER_ICON", user_icon, PARSE_MODE_NONE),
+                ("NAME", name),
+                ("BOT_TAG", is_bot, PARSE_MODE_NONE),
                 ("TIMESTAMP", str(self.message_created_at)),
                 ("DEFAULT_TIMESTAMP", str(default_timestamp), PARSE_MODE_NONE),
                 ("MESSAGE_ID", str(self.message.id)),
@@ -344,7 +379,7 @@ class MessageConstruct:
         self.message_html += await fill_out(self.guild, message_pin, [
             ("PIN_URL", DiscordUtils.pinned_message_icon, PARSE_MODE_NONE),
             ("USER_COLOUR", await self._gather_user_colour(self.message.author)),
-            ("NAME", str(html.escape(self.message.author.display_name))),
+            ("NAME", str(escape(self.message.author.display_name))),
             ("NAME_TAG", await discriminator(self.message.author.name, self.message.author.discriminator), PARSE_MODE_NONE),
             ("MESSAGE_ID", str(self.message.id), PARSE_MODE_NONE),
             ("REF_MESSAGE_ID", str(self.message.reference.message_id) if self.message.reference else "", PARSE_MODE_NONE)
@@ -356,7 +391,7 @@ class MessageConstruct:
              PARSE_MODE_NONE),
             ("THREAD_NAME", self.message.content, PARSE_MODE_NONE),
             ("USER_COLOUR", await self._gather_user_colour(self.message.author)),
-            ("NAME", str(html.escape(self.message.author.display_name))),
+            ("NAME", str(escape(self.message.author.display_name))),
             ("NAME_TAG", await discriminator(self.message.author.name, self.message.author.discriminator), PARSE_MODE_NONE),
             ("MESSAGE_ID", str(self.message.id), PARSE_MODE_NONE),
         ])
@@ -367,11 +402,11 @@ class MessageConstruct:
             ("THREAD_URL", DiscordUtils.thread_remove_recipient,
              PARSE_MODE_NONE),
             ("USER_COLOUR", await self._gather_user_colour(self.message.author)),
-            ("NAME", str(html.escape(self.message.author.display_name))),
+            ("NAME", str(escape(self.message.author.display_name))),
             ("NAME_TAG", await discriminator(self.message.author.name, self.message.author.discriminator),
              PARSE_MODE_NONE),
             ("RECIPIENT_USER_COLOUR", await self._gather_user_colour(removed_member)),
-            ("RECIPIENT_NAME", str(html.escape(removed_member.display_name))),
+            ("RECIPIENT_NAME", str(escape(removed_member.display_name))),
             ("RECIPIENT_NAME_TAG", await discriminator(removed_member.name, removed_member.discriminator),
              PARSE_MODE_NONE),
             ("MESSAGE_ID", str(self.message.id), PARSE_MODE_NONE),
@@ -383,11 +418,11 @@ class MessageConstruct:
             ("THREAD_URL", DiscordUtils.thread_add_recipient,
              PARSE_MODE_NONE),
             ("USER_COLOUR", await self._gather_user_colour(self.message.author)),
-            ("NAME", str(html.escape(self.message.author.display_name))),
+            ("NAME", str(escape(self.message.author.display_name))),
             ("NAME_TAG", await discriminator(self.message.author.name, self.message.author.discriminator),
              PARSE_MODE_NONE),
             ("RECIPIENT_USER_COLOUR", await self._gather_user_colour(removed_member)),
-            ("RECIPIENT_NAME", str(html.escape(removed_member.display_name))),
+            ("RECIPIENT_NAME", str(escape(removed_member.display_name))),
             ("RECIPIENT_NAME_TAG", await discriminator(removed_member.name, removed_member.discriminator),
              PARSE_MODE_NONE),
             ("MESSAGE_ID", str(self.message.id), PARSE_MODE_NONE),
@@ -395,6 +430,9 @@ class MessageConstruct:
 
     @cache()
     async def _gather_member(self, author: discord.Member):
+        if author.id in self.member_dict:
+            return self.member_dict[author.id]
+
         member = self.guild.get_member(author.id)
 
         if member:
@@ -405,6 +443,19 @@ class MessageConstruct:
         except Exception:
             return None
 
+    @cache()
+    async def _gather_author(self, author: discord.Member):
+        # the message header of an author is the same for all their messages, work it out once per transcript
+        avatar_url = author.display_avatar if author.display_avatar else DiscordUtils.default_avatar
+        return (
+            str(avatar_url),
+            await discriminator(author.name, author.discriminator),
+            await self._gather_user_colour(author),
+            await self._gather_user_icon(author),
+            str(escape(author.display_name)),
+            str(_gather_user_bot(author)),
+        )
+
     async def _gather_user_colour(self, author: discord.Member):
         member = await self._gather_member(author)
         user_colour = member.colour if member and str(member.colour) != "#000000" else "#FFFFFF"
@@ -431,21 +482,47 @@ class MessageConstruct:
 
     def to_local_time_str(self, time):
         if not self.message.created_at.tzinfo:
-            time = timezone("UTC").localize(time)
+            time = time.replace(tzinfo=timezone.utc)
+
+        return _format_time(time, self.tz, self.time_format)
+
 
-        local_time = time.astimezone(timezone(self.pytz_timezone))
+async def _prefetch_members(
+    messages: List[discord.Message],
+    guild: discord.Guild,
+    concurrency: int,
+    max_retries: int,
+) -> dict:
+    """Fetch every author missing from the member cache up front, a few at a time, instead of one per message."""
+    missing = [
+        user_id for user_id in {message.author.id for message in messages}
+        if guild.get_member(user_id) is None
+    ]
+    semaphore = asyncio.Semaphore(concurrency)
 
-        return local_time.strftime(self.time_format)
+    async def fetch(user_id: int):
+        async with semaphore:
+            return await retry(guild.fetch_member, user_id, max_retries=max_retries)
+
+    results = await asyncio.gather(*(fetch(user_id) for user_id in missing), return_exceptions=True)
+
+    # authors who have left the guild (or were never in it) are remembered as None so they aren't fetched again
+    return {
+        user_id: None if isinstance(result, BaseException) else result
+        for user_id, result in zip(missing, results)
+    }
 
 
 async def gather_messages(
     messages: List[discord.Message],
     guild: discord.Guild,
-    pytz_timezone,
+    tz: tzinfo,
     military_time,
     attachment_handler: Optional[AttachmentHandler],
-) -> (str, dict):
-    message_html: str = ""
+    write,
+    concurrency: int = 8,
+    max_retries: int = 5,
+) -> dict:
     meta_data: dict = {}
     previous_message: Optional[discord.Message] = None
 
@@ -461,20 +538,28 @@ async def gather_messages(
         messages[0] = message
         messages[0].reference = None
 
+    member_dict = await _prefetch_members(messages, guild, concurrency, max_retries)
+
+    # the handler is only ever called per attachment, don't carry it through a channel that has none
+    if not any(message.attachments for message in messages):
+        attachment_handler = None
+
     for message in messages:
         content_html, meta_data = await MessageConstruct(
             message,
             previous_message,
-            pytz_timezone,
+            tz,
             military_time,
             guild,
             meta_data,
             message_dict,
             attachment_handler,
+            member_dict,
             ).construct_message()
 
-        message_html += content_html
+        # handed on straight away, a transcript being written to a file never holds all of its messages
+        await write(content_html)
         previous_message = message
 
-    message_html += "</div>"
-    return message_html, meta_data
+    await write("</div>")
+    return meta_data
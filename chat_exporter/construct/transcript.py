@@ -1,11 +1,11 @@
+import asyncio
 import datetime
-import html
+import io
+import os
 import traceback
 
 import re
-from typing import List, Optional
-
-import pytz
+from typing import BinaryIO, List, Optional, Union
 
 from chat_exporter.construct.attachment_handler import AttachmentHandler
 from chat_exporter.ext.discord_import import discord
@@ -16,13 +16,26 @@ from chat_exporter.construct.assets.component import Component
 from chat_exporter.ext.cache import clear_cache
 from chat_exporter.parse.mention import pass_bot
 from chat_exporter.ext.discord_utils import DiscordUtils
+from chat_exporter.ext.escape import escape
+from chat_exporter.ext.retry import backoff, rate_limited
+from chat_exporter.ext.zoneinfo_import import get_timezone
 from chat_exporter.ext.html_generator import (
-    fill_out, total, channel_topic, meta_data_temp, fancy_time, channel_subject, PARSE_MODE_NONE
+    fill_out, total_head, total_tail, StaticText, channel_topic, meta_data_temp, fancy_time, channel_subject,
+    PARSE_MODE_NONE
 )
 
+# parts are gathered up to this many bytes before they are written out to a file
+WRITE_BUFFER_SIZE = 64 * 1024
+
+
+def _encode(part: str) -> bytes:
+    # the page's static blocks come encoded already
+    return part.encoded if isinstance(part, StaticText) else part.encode("utf-8", errors="replace")
+
 
 class TranscriptDAO:
-    html: str
+    html_parts: List[str]
+    failed: bool = False
 
     def __init__(
         self,
@@ -37,6 +50,8 @@ class TranscriptDAO:
         support_dev: bool,
         bot: Optional[discord.Client],
         attachment_handler: Optional[AttachmentHandler],
+        concurrency: int = 8,
+        max_retries: int = 5,
     ):
         self.channel = channel
         self.messages = messages
@@ -47,71 +62,78 @@ class TranscriptDAO:
         self.after = after
         self.support_dev = support_dev
         self.pytz_timezone = pytz_timezone
+        self.tz = None
         self.attachment_handler = attachment_handler
-
-        # This is to pass timezone in to mention.py without rewriting
-        setattr(discord.Guild, "timezone", self.pytz_timezone)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
 
         if bot:
             pass_bot(bot)
 
-    async def build_transcript(self):
-        message_html, meta_data = await gather_messages(
+    async def build_transcript(self, write=None):
+        """
+        Render the transcript in to html_parts, or hand every part to write as soon as it is rendered.
+        :param write: (optional) coroutine function called with each str part of the page, in order
+        """
+        # looked up here rather than in __init__, so an unknown zone fails the build like any other error
+        self.tz = get_timezone(self.pytz_timezone)
+        self.html_parts = []
+        if write is None:
+            write = self.collect_part
+
+        # the head of the page only needs the channel, the messages are written out right after it
+        replacements = await self.page_replacements()
+        for part in await self.fill_out_page(total_head, replacements):
+            await write(part)
+
+        meta_data = await gather_messages(
             self.messages,
             self.channel.guild,
-            self.pytz_timezone,
+            self.tz,
             self.military_time,
-            self.attachment_handler
+            self.attachment_handler,
+            write,
+            self.concurrency,
+            self.max_retries,
         )
-        await self.export_transcript(message_html, meta_data)
+
+        replacements += await self.participant_replacements(meta_data)
+        for part in await self.fill_out_page(total_tail, replacements):
+            await write(part)
+
         clear_cache()
         Component.menu_div_id = 0
         return self
 
-    async def export_transcript(self, message_html: str, meta_data: str):
+    async def collect_part(self, part: str):
+        self.html_parts.append(part)
+
+    @property
+    def html(self) -> str:
+        """The full transcript, joined from html_parts on every access."""
+        return "".join(self.html_parts)
+
+    def write_parts(self, f: BinaryIO):
+        """Write html_parts to a binary file object, UTF-8 encoding them one at a time."""
+        for part in self.html_parts:
+            f.write(_encode(part))
+
+    async def page_replacements(self) -> list:
         guild_icon = self.channel.guild.icon if (
                 self.channel.guild.icon and len(self.channel.guild.icon) > 2
         ) else DiscordUtils.default_avatar
 
-        guild_name = html.escape(self.channel.guild.name)
+        guild_name = escape(self.channel.guild.name)
 
-        timezone = pytz.timezone(self.pytz_timezone)
         if self.military_time:
-            time_now = datetime.datetime.now(timezone).strftime("%e %B %Y at %H:%M:%S (%Z)")
+            time_now = datetime.datetime.now(self.tz).strftime("%e %B %Y at %H:%M:%S (%Z)")
         else:
-            time_now = datetime.datetime.now(timezone).strftime("%e %B %Y at %I:%M:%S %p (%Z)")
-
-        meta_data_html: str = ""
-        for data in meta_data:
-            creation_time = meta_data[int(data)][1].astimezone(timezone).strftime("%b %d, %Y")
-            joined_time = (
-                meta_data[int(data)][5].astimezone(timezone).strftime("%b %d, %Y")
-                if meta_data[int(data)][5] else "Unknown"
-            )
-
-            pattern = r'^#\d{4}'
-            discrim = str(meta_data[int(data)][0][-5:])
-            user = str(meta_data[int(data)][0])
-
-            meta_data_html += await fill_out(self.channel.guild, meta_data_temp, [
-                ("USER_ID", str(data), PARSE_MODE_NONE),
-                ("USERNAME", user[:-5] if re.match(pattern, discrim) else user, PARSE_MODE_NONE),
-                ("DISCRIMINATOR", discrim if re.match(pattern, discrim) else ""),
-                ("BOT", str(meta_data[int(data)][2]), PARSE_MODE_NONE),
-                ("CREATED_AT", str(creation_time), PARSE_MODE_NONE),
-                ("JOINED_AT", str(joined_time), PARSE_MODE_NONE),
-                ("GUILD_ICON", str(guild_icon), PARSE_MODE_NONE),
-                ("DISCORD_ICON", str(DiscordUtils.logo), PARSE_MODE_NONE),
-                ("MEMBER_ID", str(data), PARSE_MODE_NONE),
-                ("USER_AVATAR", str(meta_data[int(data)][3]), PARSE_MODE_NONE),
-                ("DISPLAY", str(meta_data[int(data)][6]), PARSE_MODE_NONE),
-                ("MESSAGE_COUNT", str(meta_data[int(data)][4]))
-            ])
+            time_now = datetime.datetime.now(self.tz).strftime("%e %B %Y at %I:%M:%S %p (%Z)")
 
         if self.military_time:
-            channel_creation_time = self.channel.created_at.astimezone(timezone).strftime("%b %d, %Y (%H:%M:%S)")
+            channel_creation_time = self.channel.created_at.astimezone(self.tz).strftime("%b %d, %Y (%H:%M:%S)")
         else:
-            channel_creation_time = self.channel.created_at.astimezone(timezone).strftime("%b %d, %Y (%I:%M:%S %p)")
+            channel_creation_time = self.channel.created_at.astimezone(self.tz).strftime("%b %d, %Y (%I:%M:%S %p)")
 
         raw_channel_topic = (
             self.channel.topic if isinstance(self.channel, discord.TextChannel) and self.channel.topic else ""
@@ -120,7 +142,7 @@ class TranscriptDAO:
         channel_topic_html = ""
         if raw_channel_topic:
             channel_topic_html = await fill_out(self.channel.guild, channel_topic, [
-                ("CHANNEL_TOPIC", html.escape(raw_channel_topic))
+                ("CHANNEL_TOPIC", escape(raw_channel_topic))
             ])
 
         limit = "start"
@@ -152,41 +174,163 @@ class TranscriptDAO:
                 ("TIMEZONE", str(self.pytz_timezone), PARSE_MODE_NONE)
             ])
 
-        self.html = await fill_out(self.channel.guild, total, [
+        replacements = [
             ("SERVER_NAME", f"{guild_name}"),
             ("GUILD_ID", str(self.channel.guild.id), PARSE_MODE_NONE),
             ("SERVER_AVATAR_URL", str(guild_icon), PARSE_MODE_NONE),
             ("CHANNEL_NAME", f"{self.channel.name}"),
             ("MESSAGE_COUNT", str(len(self.messages))),
-            ("MESSAGES", message_html, PARSE_MODE_NONE),
-            ("META_DATA", meta_data_html, PARSE_MODE_NONE),
             ("DATE_TIME", str(time_now)),
             ("SUBJECT", subject, PARSE_MODE_NONE),
             ("CHANNEL_CREATED_AT", str(channel_creation_time), PARSE_MODE_NONE),
             ("CHANNEL_TOPIC", str(channel_topic_html), PARSE_MODE_NONE),
             ("CHANNEL_ID", str(self.channel.id), PARSE_MODE_NONE),
-            ("MESSAGE_PARTICIPANTS", str(len(meta_data)), PARSE_MODE_NONE),
             ("FANCY_TIME", _fancy_time, PARSE_MODE_NONE),
             ("SD", sd, PARSE_MODE_NONE)
-        ])
+        ]
+
+        return replacements
+
+    async def participant_replacements(self, meta_data: dict) -> list:
+        guild_icon = self.channel.guild.icon if (
+                self.channel.guild.icon and len(self.channel.guild.icon) > 2
+        ) else DiscordUtils.default_avatar
+
+        meta_data_html: List[str] = []
+        for data in meta_data:
+            creation_time = meta_data[int(data)][1].astimezone(self.tz).strftime("%b %d, %Y")
+            joined_time = (
+                meta_data[int(data)][5].astimezone(self.tz).strftime("%b %d, %Y")
+                if meta_data[int(data)][5] else "Unknown"
+            )
+
+            pattern = r'^#\d{4}'
+            discrim = str(meta_data[int(data)][0][-5:])
+            user = str(meta_data[int(data)][0])
+
+            meta_data_html.append(await fill_out(self.channel.guild, meta_data_temp, [
+                ("USER_ID", str(data), PARSE_MODE_NONE),
+                ("USERNAME", user[:-5] if re.match(pattern, discrim) else user, PARSE_MODE_NONE),
+                ("DISCRIMINATOR", discrim if re.match(pattern, discrim) else ""),
+                ("BOT", str(meta_data[int(data)][2]), PARSE_MODE_NONE),
+                ("CREATED_AT", str(creation_time), PARSE_MODE_NONE),
+                ("JOINED_AT", str(joined_time), PARSE_MODE_NONE),
+                ("GUILD_ICON", str(guild_icon), PARSE_MODE_NONE),
+                ("DISCORD_ICON", str(DiscordUtils.logo), PARSE_MODE_NONE),
+                ("MEMBER_ID", str(data), PARSE_MODE_NONE),
+                ("USER_AVATAR", str(meta_data[int(data)][3]), PARSE_MODE_NONE),
+                ("DISPLAY", str(meta_data[int(data)][6]), PARSE_MODE_NONE),
+                ("MESSAGE_COUNT", str(meta_data[int(data)][4]))
+            ]))
+
+        return [
+            ("META_DATA", "".join(meta_data_html), PARSE_MODE_NONE),
+            ("MESSAGE_PARTICIPANTS", str(len(meta_data)), PARSE_MODE_NONE),
+        ]
+
+    async def fill_out_page(self, pieces, replacements) -> List[str]:
+        return [
+            text if is_static else await fill_out(self.channel.guild, text, replacements)
+            for is_static, text in pieces
+        ]
 
 
 class Transcript(TranscriptDAO):
-    async def export(self):
+    async def fetch_history(self) -> List[discord.Message]:
+        messages: List[discord.Message] = []
+        before, after = self.before, self.after
+        attempt = 0
+
+        while True:
+            limit = self.limit - len(messages) if self.limit else None
+            if limit == 0:
+                return messages
+
+            try:
+                async for message in self.channel.history(limit=limit, before=before, after=after):
+                    messages.append(message)
+                return messages
+            except Exception as e:
+                if not rate_limited(e) or attempt >= self.max_retries:
+                    raise
+
+            # pick up after the last message we got rather than starting over
+            if messages:
+                if self.after:
+                    after = messages[-1]
+                else:
+                    before = messages[-1]
+
+            await backoff(attempt)
+            attempt += 1
+
+    async def export(self, write=None):
         if not self.messages:
-            self.messages = [message async for message in self.channel.history(
-                limit=self.limit,
-                before=self.before,
-                after=self.after,
-            )]
+            self.messages = await self.fetch_history()
 
         if not self.after:
             self.messages.reverse()
 
         try:
-            return await super().build_transcript()
+            return await super().build_transcript(write)
         except Exception:
-            self.html = "Whoops! Something went wrong..."
+            self.html_parts = ["Whoops! Something went wrong..."]
+            self.failed = True
             traceback.print_exc()
             print("Please send a screenshot of the above error to https://www.github.com/mahtoid/DiscordChatExporterPy")
             return self
+
+    async def export_bytes(self) -> bytes:
+        """Export the transcript UTF-8 encoded, one part at a time, without joining it in to a single str first."""
+        await self.export()
+
+        buffer = io.BytesIO()
+        self.write_parts(buffer)
+        return buffer.getvalue()
+
+    async def export_to_file(self, f: Union[str, os.PathLike, BinaryIO]):
+        """
+        Export the transcript straight in to a file, writing each part out as soon as it is rendered.
+        Nothing is written if the transcript fails to build. A file object is truncated back to where it was,
+        which needs it to be seekable.
+        :param f: path to write to, or a file object opened in binary mode
+        """
+        if not isinstance(f, (str, os.PathLike)):
+            start = f.tell() if f.seekable() else None
+            await self.stream_to(f)
+            if self.failed and start is not None:
+                f.seek(start)
+                f.truncate()
+            return self
+
+        # write next to the target and only move it in place once the whole transcript made it
+        partial = os.fspath(f) + ".part"
+        try:
+            with open(partial, "wb") as file:
+                await self.stream_to(file)
+            if not self.failed:
+                os.replace(partial, f)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return self
+
+    async def stream_to(self, f: BinaryIO):
+        """Export the transcript in to a binary file object, encoding and writing it while it is rendered."""
+        loop = asyncio.get_running_loop()
+        buffer = io.BytesIO()
+
+        async def flush():
+            # disk writes would block the event loop, hand them to a worker thread
+            await loop.run_in_executor(None, f.write, buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+
+        async def write(part: str):
+            buffer.write(_encode(part))
+            if buffer.tell() >= WRITE_BUFFER_SIZE:
+                await flush()
+
+        await self.export(write)
+        if not self.failed:
+            await flush()
@@ -1,5 +1,7 @@
+import time
+from collections import OrderedDict
 from functools import wraps
-from typing import Any
+from typing import Any, Optional
 
 _internal_cache: dict = {}
 
@@ -55,3 +57,36 @@ def cache():
         wrapper.clear_cache = _internal_cache.clear()
         return wrapper
     return decorator
+
+
+class TTLCache:
+    """A small LRU mapping whose entries expire ``ttl`` seconds after being stored."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple[float, Any]]" = OrderedDict()
+
+    def __getitem__(self, key):
+        expires, value = self._data[key]
+        if expires < time.monotonic():
+            del self._data[key]
+            raise KeyError(key)
+        self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        """Store value under key, expiring after ttl seconds instead of the cache's own ttl if given."""
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
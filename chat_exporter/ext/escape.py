@@ -0,0 +1,7 @@
+try:
+    from markupsafe import escape as _escape
+except ImportError:
+    from html import escape
+else:
+    def escape(s: str) -> str:
+        return str(_escape(s))
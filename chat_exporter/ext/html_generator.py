@@ -1,4 +1,6 @@
+import functools
 import os
+import re
 
 from chat_exporter.parse.mention import ParseMention
 from chat_exporter.parse.markdown import ParseMarkdown
@@ -13,8 +15,67 @@ PARSE_MODE_SPECIAL_EMBED = 4
 PARSE_MODE_REFERENCE = 5
 PARSE_MODE_EMOJI = 6
 
+PLACEHOLDER = re.compile(r"{{(\w+)}}")
+
+
+class _Placeholders(dict):
+    def __missing__(self, key):
+        # placeholders without a replacement are left in the output as they are
+        return "{{" + key + "}}"
+
+
+@functools.lru_cache(maxsize=128)
+def compile_template(base):
+    """
+    Compile a {{KEY}} template once in to a str.format_map renderer.
+    :return: (renderer, frozenset of the keys used by the template)
+    """
+    pieces = PLACEHOLDER.split(base)
+    pieces[::2] = [piece.replace("{", "{{").replace("}", "}}") for piece in pieces[::2]]
+    keys = frozenset(pieces[1::2])
+    pieces[1::2] = ["{" + key + "}" for key in pieces[1::2]]
+    return "".join(pieces).format_map, keys
+
+
+class StaticText(str):
+    """A static run of the page, carrying its UTF-8 encoding so writers don't encode it per transcript."""
+
+    def __new__(cls, text):
+        self = super().__new__(cls, text)
+        self.encoded = text.encode("utf-8")
+        return self
+
+
+def split_static(base, min_length=1024):
+    """
+    Cut a template around its long runs of static text, so those can be emitted as they are.
+    :return: list of (is_static, text) pieces, static ones are StaticText, the others are still templates
+    """
+    pieces = []
+    start = last = 0
+
+    for match in PLACEHOLDER.finditer(base):
+        if match.start() - last >= min_length:
+            if last > start:
+                pieces.append((False, base[start:last]))
+            pieces.append((True, StaticText(base[last:match.start()])))
+            start = match.start()
+        last = match.end()
+
+    if len(base) - last >= min_length:
+        if last > start:
+            pieces.append((False, base[start:last]))
+        pieces.append((True, StaticText(base[last:])))
+    elif len(base) > start:
+        pieces.append((False, base[start:]))
+
+    return pieces
+
 
 async def fill_out(guild, base, replacements):
+    render, keys = compile_template(base)
+    values = _Placeholders()
+
     for r in replacements:
         if len(r) == 2:  # default case
             k, v = r
@@ -22,6 +83,10 @@ async def fill_out(guild, base, replacements):
 
         k, v, mode = r
 
+        # nothing to fill, don't bother parsing the value
+        if k not in keys or k in values:
+            continue
+
         if mode != PARSE_MODE_NONE:
             v = await ParseMention(v, guild).flow()
         if mode == PARSE_MODE_MARKDOWN:
@@ -35,9 +100,10 @@ async def fill_out(guild, base, replacements):
         elif mode == PARSE_MODE_EMOJI:
             v = await ParseMarkdown(v).special_emoji_flow()
 
-        base = base.replace("{{" + k + "}}", v.strip())
+        values[k] = v.strip()
 
-    return base
+    # a single pass over the template, so replaced values are never scanned for placeholders again
+    return render(values)
 
 
 def read_file(filename):
@@ -93,6 +159,7 @@ video_attachment = read_file(dir_path + "/html/attachment/video.html")
 
 # GUILD / FULL TRANSCRIPT
 total = read_file(dir_path + "/html/base.html")
+total_head, _, total_tail = (split_static(piece) for piece in total.partition("{{MESSAGES}}"))
 
 # SCRIPT
 fancy_time = read_file(dir_path + "/html/script/fancy_time.html")
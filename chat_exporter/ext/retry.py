@@ -0,0 +1,26 @@
+import asyncio
+
+from chat_exporter.ext.discord_import import discord
+
+BACKOFF_BASE = 1.0
+
+
+def rate_limited(error: BaseException) -> bool:
+    return isinstance(error, discord.HTTPException) and error.status == 429
+
+
+async def backoff(attempt: int):
+    await asyncio.sleep(BACKOFF_BASE * 2 ** attempt)
+
+
+async def retry(func, *args, max_retries: int = 5):
+    """Await func(*args), backing off exponentially and trying again while Discord answers with a 429."""
+    attempt = 0
+    while True:
+        try:
+            return await func(*args)
+        except discord.HTTPException as e:
+            if not rate_limited(e) or attempt >= max_retries:
+                raise
+        await backoff(attempt)
+        attempt += 1
@@ -0,0 +1,27 @@
+import functools
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+except ImportError:  # Python 3.8 and older
+    from backports.zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+
+@functools.lru_cache(maxsize=1)
+def _canonical_names() -> dict:
+    # scanning the tz database is slow, it is only done once and only for a name that missed
+    return {name.lower(): name for name in available_timezones()}
+
+
+def get_timezone(name: str) -> ZoneInfo:
+    """
+    Look up a zone by its TZ database name, ignoring case the way pytz.timezone() did.
+    :param name: TZ database name, e.g. "Europe/Berlin" or "utc"
+    :return: ZoneInfo
+    """
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        canonical = _canonical_names().get(str(name).lower())
+        if canonical is None:
+            raise
+        return ZoneInfo(canonical)
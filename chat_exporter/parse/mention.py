@@ -1,7 +1,6 @@
 import re
 from typing import Optional
 
-import pytz
 import datetime
 import time
 
@@ -173,10 +172,6 @@ class ParseMention:
 
     async def time_mention(self):
         holder = self.REGEX_TIME_HOLDER
-        timezone = pytz.timezone("UTC")
-
-        if hasattr(self.guild, "timezone"):
-            timezone = pytz.timezone(self.guild.timezone)
 
         for p in holder:
             regex, strf = p
@@ -184,7 +179,7 @@ class ParseMention:
             while match is not None:
                 timestamp = int(match.group(1)) - 1
                 time_stamp = time.gmtime(timestamp)
-                datetime_stamp = datetime.datetime(2010, *time_stamp[1:6], tzinfo=pytz.utc)
+                datetime_stamp = datetime.datetime(2010, *time_stamp[1:6], tzinfo=datetime.timezone.utc)
                 ui_time = datetime_stamp.strftime(strf)
                 ui_time = ui_time.replace(str(datetime_stamp.year), str(time_stamp[0]))
                 tooltip_time = datetime_stamp.strftime("%A, %e %B %Y at %H:%M")